@@ -1,12 +1,21 @@
 from abc import ABCMeta, abstractmethod
 import os
+import math
+from fnmatch import fnmatch
+from collections import OrderedDict
 import fitsio
 import h5py
 import numpy as np
-from astropy.table import Table, vstack, join
+from astropy.table import Table, MaskedColumn, vstack, join
 import matplotlib.pyplot as plt
 import pudb
 
+# numba is optional; used for a faster fused flux -> mag calculation
+try:
+    import numba
+except ImportError:
+    numba = None
+
 # NOTE: Try using generators for Table chunks if files get too large!
 # http://docs.astropy.org/en/stable/io/ascii/read.html#reading-large-tables-in-chunks
 
@@ -14,11 +23,96 @@ import pudb
 # matters much if we're careful about what we load into memory in the first place
 # (i.e. using `cols`)
 
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True)
+    def _flux_to_mag(flux, out, zp, clip_val):
+        '''
+        Same as `Catalog.flux2mag()`, but computed in a single pass
+        that writes straight into `out`
+        '''
+        for i in numba.prange(flux.shape[0]):
+            out[i] = -2.5 * math.log10(max(flux[i], clip_val)) + zp
+
+def _match_rows(left_key, right_key):
+    '''
+    Find the rows of `right_key` matching each entry of `left_key`, assuming
+    the right keys are unique. Returns the (left, right) indices of all matches
+    '''
+
+    left_key = np.asarray(left_key)
+    right_key = np.asarray(right_key)
+
+    if len(left_key) == 0 or len(right_key) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    # Catalogs often come already sorted by id, in which case we can
+    # skip the argsort entirely
+    is_sorted = np.all(right_key[1:] >= right_key[:-1])
+    if is_sorted:
+        sorted_key = right_key
+    else:
+        order = np.argsort(right_key, kind='stable')
+        sorted_key = right_key[order]
+
+    pos = np.searchsorted(sorted_key, left_key)
+    np.clip(pos, 0, len(sorted_key)-1, out=pos)
+    valid = sorted_key[pos] == left_key
+
+    left_idx = np.nonzero(valid)[0]
+    if is_sorted:
+        right_idx = pos[valid]
+    else:
+        right_idx = order[pos[valid]]
+
+    return left_idx, right_idx
+
+def _inner_join(left, right, key='bal_id'):
+    '''
+    Inner join of two Tables on a single key that is unique in `right`.
+    Much faster than astropy's `join()` for large catalogs.
+
+    NOTE: Unlike `join()` without `keys`, which joins on *every* shared
+    column, this only joins on `key`. Any other shared columns are kept
+    from both tables, with the '_1' and '_2' suffixes that `join()` uses.
+    Column masks, units, and descriptions are kept
+    '''
+
+    left_idx, right_idx = _match_rows(left[key], right[key])
+
+    # Gather each column into its own contiguous Column and wrap them all
+    # in a Table at once, rather than adding them one by one
+    names, cols = [], []
+    for col in left.colnames:
+        if (col != key) and (col in right.colnames):
+            names.append(col + '_1')
+        else:
+            names.append(col)
+        cols.append(left[col][left_idx])
+
+    for col in right.colnames:
+        if col == key:
+            continue
+        if col in left.colnames:
+            names.append(col + '_2')
+        else:
+            names.append(col)
+        cols.append(right[col][right_idx])
+
+    return Table(cols, names=names, copy=False)
+
 # NOTE: `Catalog` should relaly be an abstract class, but something in how
 # I'm using ABCMeta is causing problems. Can fix later if we care
 # class Catalog(ABCMeta):
 class Catalog(object):
 
+    # Smallest dtypes needed for columns used in cuts, which are often stored
+    # with much wider types on disk. Keys can be glob patterns
+    _dtype_hints = {'flags_foreground': 'u1',
+                    'flags_badregions': 'u1',
+                    'flags_footprint': 'u1',
+                    'meas_FLAGS_GOLD*': 'u1'
+                    }
+
     def __init__(self, filename, cols=None):
         self.filename = filename
         self.cols = cols
@@ -37,11 +131,55 @@ class Catalog(object):
         return -2.5 * np.log10(flux.clip(clip_val)) + zp
 
     def apply_cut(self, cut):
+        # Convert boolean masks to row indices once, rather than
+        # having each column of the table re-evaluate the mask
+        if isinstance(cut, np.ndarray) and cut.dtype == bool \
+           and len(cut) == len(self._cat):
+            cut = np.nonzero(cut)[0]
+
         self._cat = self._cat[cut]
         self.Nobjs = len(self._cat)
 
         return
 
+    def _compact_dtypes(self, cols=None):
+        '''
+        Downcast any integer columns matching `_dtype_hints` to the hinted
+        dtype, as long as all of their values fit
+        '''
+
+        if cols is None:
+            cols = self._cat.colnames
+
+        for col in cols:
+            hint = None
+            for pattern, dtype in self._dtype_hints.items():
+                if fnmatch(col, pattern):
+                    hint = np.dtype(dtype)
+                    break
+            if hint is None:
+                continue
+
+            data = np.asarray(self._cat[col])
+            if (data.dtype.kind not in 'iu') or (data.dtype.itemsize <= hint.itemsize):
+                continue
+
+            if len(data) > 0:
+                info = np.iinfo(hint)
+                if (data.min() < info.min) or (data.max() > info.max):
+                    continue
+
+            self._cat.replace_column(col, data.astype(hint))
+
+        return
+
+    def _col(self, name):
+        '''
+        Returns the underlying array of a column, skipping the overhead
+        of operating on astropy Column objects in cuts
+        '''
+        return self[name].data
+
     def get_cat(self):
         return self._cat
 
@@ -122,11 +260,19 @@ class GoldCatalog(Catalog):
 
     def apply_gold_cuts(self):
         self._check_for_cols(self._gold_cut_cols[self.match_type])
-        gold_cuts = np.where( (self._cat['flags_foreground'] == 0) &
-                              (self._cat['flags_badregions'] < 2) &
-                              (self._cat['flags_footprint'] == 1) &
-                              (self._cat[self.flags_gold_colname] < 2)
-                            )
+        # Boolean masks avoid the extra index array that np.where builds.
+        # The mask is built in place in a single buffer, with the most
+        # restrictive cuts first
+        ff = self._col('flags_foreground')
+        fb = self._col('flags_badregions')
+        fp = self._col('flags_footprint')
+        fg = self._col(self.flags_gold_colname)
+
+        gold_cuts = np.empty(len(self._cat), dtype=bool)
+        np.equal(ff, 0, out=gold_cuts)
+        np.logical_and(gold_cuts, fp == 1, out=gold_cuts)
+        np.logical_and(gold_cuts, fb < 2, out=gold_cuts)
+        np.logical_and(gold_cuts, fg < 2, out=gold_cuts)
         self.apply_cut(gold_cuts)
 
         return
@@ -134,12 +280,163 @@ class GoldCatalog(Catalog):
     pass
 
 class FitsCatalog(Catalog):
+    # Number of rows to read from disk at a time
+    _chunk_rows = 1000000
+
+    def _load_catalog(self):
+        '''
+        Read the table in row chunks into a single preallocated array
+        so that the Table can wrap it without making a second copy
+        '''
+
+        with fitsio.FITS(self.filename) as fits:
+            hdu = fits[1]
+            N = hdu.get_nrows()
+
+            if self.cols is not None:
+                data = hdu[self.cols]
+            else:
+                data = hdu
+
+            buf = None
+            for start in range(0, N, self._chunk_rows):
+                end = min(start + self._chunk_rows, N)
+                chunk = data[start:end]
+                if buf is None:
+                    buf = np.empty(N, dtype=chunk.dtype)
+                buf[start:end] = chunk
+
+            if buf is None:
+                # Empty table, so there's nothing to read but the column types.
+                # Column names are matched case-insensitively, like fitsio does
+                if self.cols is None:
+                    colnums = None
+                else:
+                    names = [c.lower() for c in hdu.get_colnames()]
+                    colnums = [names.index(c.lower()) for c in self.cols]
+                buf = np.empty(0, dtype=hdu.get_rec_dtype(colnums=colnums)[0])
+
+        self._cat = Table(buf, copy=False)
+        self._compact_dtypes()
+        self.Nobjs = len(self._cat)
+
+        return
+
+class ParquetCatalog(Catalog):
+    '''
+    Column-store alternative to FITS or HDF5 catalogs. Only the requested
+    columns are ever read, using pyarrow's multithreaded reader. Use
+    `ParquetCatalog.convert()` to write an existing catalog to Parquet
+    '''
+
     def _load_catalog(self):
-        self._cat = Table(fitsio.read(self.filename, columns=self.cols))
+        import pyarrow.parquet as pq
+
+        tbl = pq.read_table(self.filename, columns=self.cols,
+                            use_threads=True, pre_buffer=True)
+
+        self._cat = Table()
+        for name in tbl.column_names:
+            data, mask = self._to_numpy(tbl.column(name), tbl.schema.field(name))
+            if mask is None:
+                self._cat[name] = data
+            else:
+                self._cat[name] = MaskedColumn(data, mask=mask)
+
+        self._compact_dtypes()
         self.Nobjs = len(self._cat)
 
         return
 
+    @staticmethod
+    def _to_numpy(col, field):
+        '''
+        Returns the column data as a numpy array, along with its mask
+        (None if there are no nulls)
+        '''
+        import pyarrow as pa
+
+        # Original numpy dtype, as saved by `convert()`. Needed to get
+        # fixed width strings back
+        dtype = None
+        if (field.metadata is not None) and (b'numpy_dtype' in field.metadata):
+            dtype = np.dtype(field.metadata[b'numpy_dtype'].decode())
+
+        # Multi-dimensional columns (e.g. one value per band) are
+        # stored as fixed size lists
+        size = None
+        if pa.types.is_fixed_size_list(col.type):
+            size = col.type.list_size
+            col = col.combine_chunks().flatten()
+
+        mask = None
+        if col.null_count > 0:
+            mask = np.asarray(col.is_null())
+            if pa.types.is_binary(col.type):
+                fill = b''
+            elif pa.types.is_string(col.type):
+                fill = ''
+            elif pa.types.is_boolean(col.type):
+                fill = False
+            else:
+                fill = 0
+            col = col.fill_null(pa.scalar(fill, type=col.type))
+
+        # Zero-copy if there is a single chunk without nulls
+        data = col.to_numpy(zero_copy_only=False)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+
+        if size is not None:
+            data = data.reshape(-1, size)
+            if mask is not None:
+                mask = mask.reshape(-1, size)
+
+        return data, mask
+
+    @staticmethod
+    def convert(catalog, outfile, compression='zstd'):
+        '''
+        Write a Catalog (e.g. a FitsCatalog or H5Catalog) to a Parquet file.
+        Masked values are written as nulls, and the numpy dtype of each
+        column is saved so that e.g. fixed width strings are read back the
+        same. Flag columns are dictionary encoded as they take very few values
+        '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        cat = catalog.get_cat()
+
+        arrays, fields = [], []
+        for col in cat.colnames:
+            data = np.asarray(cat[col])
+            if not data.dtype.isnative:
+                # FITS data is big-endian, which arrow can't handle
+                data = data.astype(data.dtype.newbyteorder('='))
+
+            mask = None
+            if isinstance(cat[col], MaskedColumn):
+                mask = np.ma.getmaskarray(cat[col])
+
+            if data.ndim == 2:
+                if mask is not None:
+                    mask = mask.ravel()
+                arr = pa.FixedSizeListArray.from_arrays(
+                    pa.array(data.ravel(), mask=mask), data.shape[1])
+            else:
+                arr = pa.array(data, mask=mask)
+
+            arrays.append(arr)
+            fields.append(pa.field(col, arr.type,
+                                   metadata={'numpy_dtype': data.dtype.str}))
+
+        tbl = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+        flag_cols = [c for c in cat.colnames if 'flag' in c.lower()]
+        pq.write_table(tbl, outfile, compression=compression,
+                       use_dictionary=flag_cols)
+
+        return
+
 # TODO: Remove if not useful
 class GoldFitsCatalog(FitsCatalog, GoldCatalog):
     def __init__(self, filename, cols=None, match_type='default'):
@@ -161,24 +458,34 @@ class DetectionCatalog(FitsCatalog, GoldCatalog):
         Balrog stack versions 1.4 and below have a small bug that
         seems to duplicate exactly 1 object, so check for these
         '''
-        unq, unq_idx, unq_cnt = np.unique(self._cat['bal_id'],
-                                          return_inverse=True,
-                                          return_counts=True)
-        Nunq = len(unq)
-        if Nunq != self.Nobjs:
-            Ndups = self.Nobjs - Nunq
-            dup_ids = unq[np.where(unq_cnt > 1)]
+        if self.Nobjs == 0:
+            return
+
+        # Duplicates are adjacent once sorted. This is much cheaper than
+        # np.unique() for the usual case where there are none
+        ids = np.asarray(self._cat['bal_id'])
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        dup_mask = np.empty(len(sorted_ids), dtype=bool)
+        dup_mask[0] = False
+        np.equal(sorted_ids[1:], sorted_ids[:-1], out=dup_mask[1:])
+
+        if dup_mask.any():
+            Ndups = np.count_nonzero(dup_mask)
+            dup_ids = np.unique(sorted_ids[dup_mask])
             print('Warning: Detection catalog has {} duplicate(s)!'.format(Ndups))
             print('Removing the following duplicates from detection catalog:')
             print(dup_ids)
 
             Nbefore = self.Nobjs
-            for did in dup_ids:
-                indx = np.where(self._cat['bal_id']==did)[0]
 
-                L = len(indx)
-                for i in range(L-1): # keep last one
-                    self._cat.remove_row(indx[i])
+            # Keep the first occurrence of each bal_id with a single cut, as
+            # each Table.remove_row() call copies the whole table. These are
+            # the same rows as np.unique(..., return_index=True), but reuse
+            # the sort from above
+            keep_idx = order[~dup_mask]
+            keep_idx.sort()
+            self._cat = self._cat[keep_idx]
 
             self.Nobjs = len(self._cat)
             assert self.Nobjs == (Nbefore - Ndups)
@@ -247,39 +554,315 @@ class BalrogMatchedCatalog(GoldCatalog):
 
 class H5Catalog(Catalog):
 
-    def __init__(self, filename, basepath, cols=None, **kwargs):
+    # Chunk cache used for lazy loading if none is given. Eager loads read
+    # each chunk exactly once, so they keep h5py's default as a
+    # larger cache would only hold on to already decompressed chunks
+    _lazy_rdcc_nbytes = 32 * 1024**2
+    _rdcc_nslots = 10007
+
+    # Defaults for lazy loading; set here as well since some subclasses
+    # (e.g. BalrogMcalCatalog) never call H5Catalog.__init__()
+    lazy = False
+    max_cache_bytes = None
+    _rows = None
+
+    def __init__(self, filename, basepath, cols=None, in_memory=False,
+                 lazy=False, max_cache_bytes=None, rdcc_nbytes=None, **kwargs):
+        '''
+        in_memory: Set to True to load the whole file into RAM on open
+                   (h5py 'core' driver). Only use if the file fits in memory!
+        rdcc_nbytes: Size of the HDF5 chunk cache of each dataset. Defaults
+                     to h5py's default, or a few chunks' worth if lazy
+        lazy: Set to True to only read columns from disk when first accessed
+        max_cache_bytes: If lazy, the least recently used columns read from
+                         disk are dropped once they take up more memory than
+                         this. They are re-read if needed. None means no limit
+        '''
         self.basepath = basepath
+        self.in_memory = in_memory
+        self.lazy = lazy
+        self.max_cache_bytes = max_cache_bytes
+        self.rdcc_nbytes = rdcc_nbytes
+        self._h5cat = None
+
+        # Columns read from disk that can be dropped & re-read, with their size
+        self._lru = OrderedDict()
+
         super(H5Catalog, self).__init__(filename, cols=cols, **kwargs)
 
         return
 
+    def _open_file(self):
+        if self.in_memory is True:
+            driver = 'core'
+        else:
+            driver = None
+
+        rdcc_nbytes = self.rdcc_nbytes
+        if (rdcc_nbytes is None) and (self.lazy is True):
+            rdcc_nbytes = self._lazy_rdcc_nbytes
+
+        cache_kwargs = {}
+        if rdcc_nbytes is not None:
+            cache_kwargs['rdcc_nbytes'] = rdcc_nbytes
+            cache_kwargs['rdcc_nslots'] = self._rdcc_nslots
+
+        return h5py.File(self.filename, 'r',
+                         libver='latest',
+                         driver=driver,
+                         **cache_kwargs)
+
     def _load_catalog(self):
-        self._h5cat = h5py.File(self.filename)
+        self._h5cat = self._open_file()
         self._cat = Table()
 
+        if self.lazy is True:
+            self.Nobjs = self._get_nrows()
+            return
+
         if self.cols is not None:
             for col in self.cols:
-                path = os.path.join(self.basepath, col)
-                self._cat[col] = self._h5cat[path][:]
+                self._set_col(col, self._read_col(col))
+
+            self._compact_dtypes()
 
         self.Nobjs = len(self._cat)
 
         return
 
-    def add_col(self, col):
+    def _read_col(self, col):
+        '''
+        Read a column directly into a preallocated array. Use `_set_col()`
+        to add it to the catalog without copying it again
+        '''
+
         path = os.path.join(self.basepath, col)
-        self._cat[col] = self._h5cat[path]
+        dset = self._h5cat[path]
+        buf = np.empty(dset.shape, dtype=dset.dtype)
+
+        if dset.size > 0:
+            dset.read_direct(buf)
+
+        # Keep in sync with any cuts made so far
+        if self._rows is not None:
+            buf = buf[self._rows]
+
+        return buf
+
+    def _set_col(self, col, buf):
+        '''
+        Add or replace a column without copying `buf`, which setting
+        the column on the Table directly would do
+        '''
+
+        if col in self._cat.colnames:
+            self._cat.replace_column(col, buf, copy=False)
+        else:
+            self._cat.add_column(buf, name=col, copy=False)
+
+        return
+
+    def _get_nrows(self):
+        if self.cols is not None:
+            return self._h5cat[os.path.join(self.basepath, self.cols[0])].shape[0]
+
+        for obj in self._h5cat[self.basepath].values():
+            if isinstance(obj, h5py.Dataset):
+                return obj.shape[0]
+
+        return 0
+
+    def _on_disk(self, col):
+        return os.path.join(self.basepath, col) in self._h5cat
+
+    def _load_col(self, col, evict=True):
+        self._set_col(col, self._read_col(col))
+        self._compact_dtypes([col])
+        self._lru[col] = self._cat[col].data.nbytes
+
+        if evict is True:
+            self._evict_cols()
+
+        return
+
+    def _evict_cols(self):
+        if self.max_cache_bytes is None:
+            return
+
+        # Always keep the most recently used column
+        while (sum(self._lru.values()) > self.max_cache_bytes) and (len(self._lru) > 1):
+            col, _ = self._lru.popitem(last=False)
+            self._cat.remove_column(col)
+
+        return
+
+    @classmethod
+    def rechunk(cls, src, dst, basepath='/', chunk_rows=1<<20):
+        '''
+        Rewrite all datasets under `basepath` of HDF5 file `src` into a new
+        file `dst` using `chunk_rows`-row chunks and bitshuffle+lz4
+        compression. Catalogs with small row chunks decompress far more data
+        than needed for each column read; after conversion, loading columns
+        runs at close to disk bandwidth.
+
+        Attributes of the datasets, of the groups under `basepath`, and of
+        the groups leading to it (including the file root) are copied too.
+
+        Requires hdf5plugin, which must also be imported when reading `dst`.
+        '''
+        import hdf5plugin
+
+        def _copy_attrs(src_obj, dst_obj):
+            for key, val in src_obj.attrs.items():
+                dst_obj.attrs[key] = val
+
+            return
+
+        with h5py.File(src, 'r') as fin, h5py.File(dst, 'w', libver='latest') as fout:
+            # Groups from the file root down to basepath
+            _copy_attrs(fin, fout)
+            path = ''
+            for part in fin[basepath].name.strip('/').split('/'):
+                if part == '':
+                    continue
+                path += '/' + part
+                _copy_attrs(fin[path], fout.require_group(path))
+
+            def _copy(name, obj):
+                if isinstance(obj, h5py.Group):
+                    _copy_attrs(obj, fout.require_group(obj.name))
+                    return
+
+                path = obj.name
+                if (obj.ndim == 0) or (obj.shape[0] == 0):
+                    fout.copy(obj, path)
+                    return
+
+                N = obj.shape[0]
+                rows = min(chunk_rows, N)
+                dset = fout.create_dataset(path,
+                                           shape=obj.shape,
+                                           dtype=obj.dtype,
+                                           chunks=(rows,)+obj.shape[1:],
+                                           **hdf5plugin.Bitshuffle(cname='lz4'))
+                _copy_attrs(obj, dset)
+
+                buf = np.empty((rows,)+obj.shape[1:], dtype=obj.dtype)
+                for start in range(0, N, rows):
+                    end = min(start + rows, N)
+                    n = end - start
+                    obj.read_direct(buf, source_sel=np.s_[start:end], dest_sel=np.s_[0:n])
+                    dset[start:end] = buf[:n]
+
+                return
+
+            fin[basepath].visititems(_copy)
+
+        return
+
+    def add_col(self, col):
+        self._set_col(col, self._read_col(col))
 
         return
 
     def delete_col(self, col):
         self._cat.remove_column(col)
+        if self.lazy is True:
+            self._lru.pop(col, None)
+
+        return
+
+    def apply_cut(self, cut):
+        if self.lazy is False:
+            super(H5Catalog, self).apply_cut(cut)
+            return
+
+        # Keep track of the selected rows so that columns not yet read
+        # (or dropped from the cache) can be cut when they are loaded
+        indx = np.arange(self.Nobjs)[cut]
+        if len(self._cat.colnames) > 0:
+            self._cat = self._cat[indx]
+
+        if self._rows is None:
+            self._rows = indx
+        else:
+            self._rows = self._rows[indx]
+        self.Nobjs = len(indx)
 
         return
 
-    def __delete__(self):
-        self._h5cat.close()
-        super(Catalog, self).__delete__()
+    def get_cat(self):
+        if (self.lazy is True) and (self.cols is not None):
+            for col in self.cols:
+                if col not in self._cat.colnames:
+                    self._load_col(col, evict=False)
+
+            # Columns were added in the order they were first used; put them
+            # in the same order as an eager load (requested columns first,
+            # then any added ones). The data is not copied
+            extra = [c for c in self._cat.colnames if c not in self.cols]
+            order = self.cols + extra
+            if self._cat.colnames != order:
+                self._cat = Table([self._cat[c] for c in order], copy=False)
+
+        return self._cat
+
+    def _check_for_cols(self, cols):
+        if self.lazy is True:
+            if not isinstance(cols, list):
+                cols = [cols]
+            cols = [c for c in cols if not self._on_disk(c)]
+
+        super(H5Catalog, self)._check_for_cols(cols)
+
+        return
+
+    def __getitem__(self, key):
+        if (self.lazy is True) and isinstance(key, str):
+            if key in self._lru:
+                self._lru.move_to_end(key)
+            elif (key not in self._cat.colnames) and self._on_disk(key):
+                self._load_col(key)
+
+        return super(H5Catalog, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        # Set columns can't be re-read from disk, so never drop them
+        if self.lazy is True:
+            self._lru.pop(key, None)
+        super(H5Catalog, self).__setitem__(key, value)
+
+        return
+
+    def __delitem__(self, key):
+        if self.lazy is True:
+            self._lru.pop(key, None)
+        super(H5Catalog, self).__delitem__(key)
+
+        return
+
+    def __contains__(self, key):
+        if self.lazy is True:
+            return (key in self._cat.colnames) or self._on_disk(key)
+
+        return super(H5Catalog, self).__contains__(key)
+
+    def __len__(self):
+        if self.lazy is True:
+            return self.Nobjs
+
+        return super(H5Catalog, self).__len__()
+
+    def close(self):
+        # Subclasses like BalrogMcalCatalog never open a file themselves
+        if getattr(self, '_h5cat', None) is not None:
+            self._h5cat.close()
+            self._h5cat = None
+
+        return
+
+    def __del__(self):
+        self.close()
 
         return
 
@@ -319,21 +902,60 @@ class McalCatalog(H5Catalog):
         Mcal catalogs don't automatically come with magnitudes
         '''
 
-        fluxes = [c for c in self._cat.colnames if 'flux' in c.lower()]
-        bands = [f[-1] for f in fluxes]
+        # Requested columns may not be loaded yet if lazy
+        colnames = list(self._cat.colnames)
+        if self.cols is not None:
+            colnames += [c for c in self.cols if c not in colnames]
 
-        for b in bands:
-            self._cat['mag_{}'.format(b)]= self.flux2mag(self._cat['flux_{}'.format(b)])
+        fluxes = [c for c in colnames if 'flux' in c.lower()]
+        bands = []
+        for f in fluxes:
+            if f[-1] not in bands:
+                bands.append(f[-1])
+
+        if len(bands) == 0:
+            return
+
+        # Single precision is plenty for magnitudes, and halves the memory
+        # of these columns for later cuts & joins
+        N = len(self)
+        if numba is not None:
+            for b in bands:
+                # numba can't handle non-native byte order (e.g. FITS-derived data)
+                flux = np.asarray(self['flux_{}'.format(b)])
+                flux = np.ascontiguousarray(flux, dtype=flux.dtype.newbyteorder('='))
+                mag = np.empty(N, dtype=np.float32)
+                _flux_to_mag(flux, mag, 30., 0.001)
+                self._cat['mag_{}'.format(b)] = mag
+
+            return
+
+        # Otherwise stack all bands so that the log is done in a single pass,
+        # reusing the stacked buffer for the result (same as flux2mag())
+        mags = np.empty((len(bands), N), dtype=np.float32)
+        for i, b in enumerate(bands):
+            mags[i] = self['flux_{}'.format(b)]
+        np.clip(mags, 0.001, None, out=mags)
+        np.log10(mags, out=mags)
+        mags *= -2.5
+        mags += 30.
+
+        for i, b in enumerate(bands):
+            self._cat['mag_{}'.format(b)] = mags[i]
 
         return
 
     def apply_shape_cuts(self):
         self._check_for_cols(self._shape_cut_cols)
-        shape_cuts = np.where( (self._cat['flags'] == 0) &
-                               (self._cat['size_ratio'] > 0.5) &
-                               (self._cat['snr'] > 10) &
-                               (self._cat['snr'] < 1000)
-                              )
+        flags = self._col('flags')
+        size_ratio = self._col('size_ratio')
+        snr = self._col('snr')
+
+        shape_cuts = np.empty(len(self._cat), dtype=bool)
+        np.equal(flags, 0, out=shape_cuts)
+        np.logical_and(shape_cuts, size_ratio > 0.5, out=shape_cuts)
+        np.logical_and(shape_cuts, snr > 10, out=shape_cuts)
+        np.logical_and(shape_cuts, snr < 1000, out=shape_cuts)
         self.apply_cut(shape_cuts)
 
         return
@@ -345,28 +967,28 @@ class McalCatalog(H5Catalog):
         self._check_for_cols(self._sompz_cut_cols)
 
         # Mag & color cuts
-        color_cuts = np.where( (self._cat['mag_i'] >= 18.) &
-                               (self._cat['mag_i'] <= 23.5) &
-                               (self._cat['mag_r'] >= 15.) &
-                               (self._cat['mag_r'] <= 26.) &
-                               (self._cat['mag_z'] >= 15.) &
-                               (self._cat['mag_z'] <= 26.) &
-                               ((self._cat['mag_z'] - self._cat['mag_i']) <= 1.5) &
-                               ((self._cat['mag_z'] - self._cat['mag_i']) >= -4.) &
-                               ((self._cat['mag_r'] - self._cat['mag_i']) <= 4.) &
-                               ((self._cat['mag_r'] - self._cat['mag_i']) >= -1.5)
+        color_cuts = np.where( (self['mag_i'] >= 18.) &
+                               (self['mag_i'] <= 23.5) &
+                               (self['mag_r'] >= 15.) &
+                               (self['mag_r'] <= 26.) &
+                               (self['mag_z'] >= 15.) &
+                               (self['mag_z'] <= 26.) &
+                               ((self['mag_z'] - self['mag_i']) <= 1.5) &
+                               ((self['mag_z'] - self['mag_i']) >= -4.) &
+                               ((self['mag_r'] - self['mag_i']) <= 4.) &
+                               ((self['mag_r'] - self['mag_i']) >= -1.5)
                               )
 
         self.apply_cut(color_cuts)
 
         # Binary star cut, taken from Alex A.
-        highe_cut = np.greater(np.sqrt(np.power(self._cat['e_1'],2.)
-                               + np.power(self._cat['e_2'],2)), 0.8)
+        highe_cut = np.greater(np.sqrt(np.power(self['e_1'],2.)
+                               + np.power(self['e_2'],2)), 0.8)
 
         c = 22.5
         m = 3.5
 
-        magT_cut = np.log10(self._cat['T']) < (c - self.flux2mag(self._cat['flux_r'])) / m
+        magT_cut = np.log10(self['T']) < (c - self.flux2mag(self['flux_r'])) / m
 
         binaries = highe_cut * magT_cut
 
@@ -374,7 +996,7 @@ class McalCatalog(H5Catalog):
 
         if use_match_flag is True:
             self._check_for_cols(self._match_flag_col)
-            match_flag_cut = np.where(self._cat[self._match_flag_col] < 2)
+            match_flag_cut = np.where(self[self._match_flag_col] < 2)
             self.apply_cut(match_flag_cut)
 
         return
@@ -389,12 +1011,12 @@ class McalCatalog(H5Catalog):
         mcal_pars = np.array([
             len(self)*[0.0],
             len(self)*[0.0],
-            self._cat['e_1'],
-            self._cat['e_2'],
-            self._cat['T'],
-            self._cat['flux_r'],
-            self._cat['flux_i'],
-            self._cat['flux_z']
+            self['e_1'],
+            self['e_2'],
+            self['T'],
+            self['flux_r'],
+            self['flux_i'],
+            self['flux_z']
         ]).T
 
         if vb is True:
@@ -457,7 +1079,7 @@ class BalrogMcalCatalog(GoldCatalog, McalCatalog):
         return
 
     def _join(self, mcal, det):
-        self._cat = join(mcal, det, join_type='inner')
+        self._cat = _inner_join(mcal, det, key='bal_id')
 
         if self.save_all is True:
             self.mcal = mcal
@@ -553,7 +1175,7 @@ class BalrogMcalCatalogs(BalrogMcalCatalog):
         return
 
     def _join(self, stype, mcal, det):
-        mcal._cat = join(mcal.get_cat(), det.get_cat(), join_type='inner')
+        mcal._cat = _inner_join(mcal.get_cat(), det.get_cat(), key='bal_id')
         self._cat[stype] = mcal
 
         if self.save_all is True:
@@ -724,7 +1346,7 @@ class MatchedCatalog(FitsCatalog):
     def __init__(self, match_file, match_cols=None, match_type='default',
                  vb=False):
 
-        super(BalrogMatchedCatalog, self).__init__(match_file, match_cols)
+        super(MatchedCatalog, self).__init__(match_file, cols=match_cols)
 
         # Would normally connect this to a Gold catalog, but the matched
         # catalogs don't have the positional flags yet
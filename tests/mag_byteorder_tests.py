@@ -0,0 +1,50 @@
+import os
+import tempfile
+import numpy as np
+import h5py
+
+import balutils.stacked_catalogs as sc
+
+def main():
+    '''
+    Check that the numba and numpy paths of McalCatalog.calc_mags() give
+    the same magnitudes, including for big-endian fluxes as found in mcal
+    files converted from FITS
+    '''
+
+    if sc.numba is None:
+        print('numba not installed; nothing to compare')
+        return
+
+    basepath = 'catalog/unsheared'
+    N = 10
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'be.h5')
+        with h5py.File(filename, 'w') as h5:
+            h5[basepath+'/bal_id'] = np.arange(N)
+            h5[basepath+'/flux_r'] = np.linspace(-1., 1e4, N).astype('>f8')
+            h5[basepath+'/flux_i'] = np.linspace(1., 1e3, N).astype('<f4')
+
+        cols = ['bal_id', 'flux_r', 'flux_i']
+        numba_mcal = sc.McalCatalog(filename, basepath, cols=cols)
+
+        numba = sc.numba
+        sc.numba = None
+        try:
+            numpy_mcal = sc.McalCatalog(filename, basepath, cols=cols)
+        finally:
+            sc.numba = numba
+
+        for b in 'ri':
+            col = 'mag_{}'.format(b)
+            np.testing.assert_allclose(numba_mcal[col], numpy_mcal[col], rtol=1e-6)
+            print('{} matches'.format(col))
+
+        numba_mcal.close()
+        numpy_mcal.close()
+
+    return
+
+if __name__ == '__main__':
+    main()